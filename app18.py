@@ -1,7 +1,14 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
+import glob
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Copy-on-Write is always on from pandas 3.0, where the option is deprecated
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 
 st.title("Group-018")
@@ -12,50 +19,169 @@ It includes pollutant trends, EPA budget data, direct awards, and application fu
 Datasets were collected from EPA, CDC, and other government sources.
 """)
 
+YEAR_COLS = [str(y) for y in range(2000, 2024)]
+CITY_DTYPES = {col: 'float32' for col in YEAR_COLS} | {
+    'CBSA': 'category',
+    'Core Based Statistical Area': 'category',
+    'Pollutant': 'category',
+    'Trend Statistic': 'category',
+}
+NATIONAL_FILES = {
+    'CO': 'Carbon_MonoxideNational.csv',
+    'NO2': 'Nitrogen_DioxideNational.csv',
+    'O3': 'OzoneNational.csv',
+    'PM10': 'PM10National.csv',
+    'PM25': 'PM25National.csv',
+    'SO2': 'Sulfur_DioxideNational.csv',
+}
+COUNTY_POLLUTANTS = [
+    'CO 2nd Max 1-hr', 'CO 2nd Max 8-hr',
+    'NO2 98th Percentile 1-hr', 'NO2 Mean 1-hr',
+    'Ozone 2nd Max 1-hr', 'Ozone 4th Max 8-hr',
+    'SO2 99th Percentile 1-hr', 'SO2 2nd Max 24-hr', 'SO2 Mean 1-hr',
+    'PM2.5 98th Percentile 24-hr', 'PM2.5 Weighted Mean 24-hr',
+    'PM10 2nd Max 24-hr', 'PM10 Mean 24-hr',
+    'Lead Max 3-Mo Avg',
+]
+MIN_TREND_POINTS = 3
+COUNTY_DTYPES = {col: 'float32' for col in COUNTY_POLLUTANTS} | {'County Code': str, 'County': str}
+# Bump whenever the dtype maps or the city/county cleaning change so stale
+# .cache/*.parquet files are not served
+CACHE_VERSION = 1
+
 # === Utility functions ===
+@st.cache_data(show_spinner=False)
 def load_csv(folder, filename):
     base_dir = os.path.dirname(__file__)
     path = os.path.join(base_dir, "datasets", folder, filename)
     return pd.read_csv(path)
 
+def load_parquet_cache(name, sources, build):
+    # Reuse the cleaned frame from .cache/ until any of its source CSVs changes
+    # or CACHE_VERSION is bumped
+    base_dir = os.path.dirname(__file__)
+    cache_dir = os.path.join(base_dir, ".cache")
+    cache_path = os.path.join(cache_dir, f"{name}-v{CACHE_VERSION}.parquet")
+    if os.path.exists(cache_path) and all(os.path.getmtime(src) <= os.path.getmtime(cache_path) for src in sources):
+        try:
+            return pd.read_parquet(cache_path)
+        except (OSError, ValueError):
+            pass  # Damaged cache file; rebuild and overwrite it below
+    df = build()
+    if not df.empty:
+        tmp_path = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".parquet.tmp")
+            os.close(fd)
+            df.to_parquet(tmp_path, compression='zstd')
+            os.replace(tmp_path, cache_path)
+        except (OSError, ValueError):
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return df
+
+def parse_amount(series):
+    return pd.to_numeric(series.str.replace(r'[\$,\s]', '', regex=True), errors='coerce')
+
+@st.cache_data(show_spinner=False)
 def load_city_data():
     base_dir = os.path.dirname(__file__)
     path = os.path.join(base_dir, "datasets", "airqualitybycity2000-2023.csv")
-    df = pd.read_csv(path)
-    df['CBSA'].fillna(method='ffill', inplace=True)
-    df['Core Based Statistical Area'].fillna(method='ffill', inplace=True)
-    return df.dropna(subset=['Pollutant', 'Trend Statistic'])
 
+    def build():
+        return (
+            pd.read_csv(path, dtype=CITY_DTYPES, engine='pyarrow')
+            .assign(**{
+                'CBSA': lambda d: d['CBSA'].ffill(),
+                'Core Based Statistical Area': lambda d: d['Core Based Statistical Area'].ffill(),
+            })
+            .dropna(subset=['Pollutant', 'Trend Statistic'])
+            .fillna(dict.fromkeys(YEAR_COLS, 0))
+        )
+
+    df = load_parquet_cache("city", [path], build)
+    return df.set_index('CBSA', drop=False).sort_index(kind='stable')
+
+@st.cache_data(show_spinner=False)
+def load_city_options():
+    # load_city_data is sorted by CBSA, so the options come out in CBSA order
+    cities = load_city_data()[['CBSA', 'Core Based Statistical Area']].drop_duplicates('CBSA').astype(str)
+    city_labels = cities['CBSA'] + " - " + cities['Core Based Statistical Area']
+    return dict(zip(city_labels, cities['CBSA']))
+
+@st.cache_data(show_spinner=False)
 def load_multiple_csvs(prefix, start, end):
     base_dir = os.path.dirname(__file__)
-    dfs = []
-    for year in range(start, end + 1):
+
+    def fetch(year):
         path = os.path.join(base_dir, "datasets", "county_datasets", f"{prefix}{year}.csv")
-        if os.path.exists(path):
-            df = pd.read_csv(path)
-            df['Year'] = year
-            df.replace('.', pd.NA, inplace=True)
-            dfs.append(df)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_csv(path, na_values=['.'], dtype=COUNTY_DTYPES, engine='pyarrow')
+        df['Year'] = year
+        return df
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        dfs = [df for df in executor.map(fetch, range(start, end + 1)) if df is not None]
     return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
 
+@st.cache_data(show_spinner=False)
+def load_county_data():
+    base_dir = os.path.dirname(__file__)
+    sources = glob.glob(os.path.join(base_dir, "datasets", "county_datasets", "conreport*.csv"))
+
+    def build():
+        df = load_multiple_csvs("conreport", 2000, 2023)
+        if not df.empty:
+            df['County'] = df['County'].astype('category')
+        return df
+
+    df = load_parquet_cache("county", sources, build)
+    if df.empty:
+        return df
+    return df.sort_values(['County', 'Year'], kind='stable').set_index('County', drop=False)
+
+@st.cache_data(show_spinner=False)
+def load_county_pollutant_counts():
+    return load_county_data().groupby(level='County', observed=True)[COUNTY_POLLUTANTS].count()
+
+@st.cache_data(show_spinner=False)
 def load_national_pollutant(pollutant_name):
-    filenames = {
-        'CO': 'Carbon_MonoxideNational.csv',
-        'NO2': 'Nitrogen_DioxideNational.csv',
-        'O3': 'OzoneNational.csv',
-        'PM10': 'PM10National.csv',
-        'PM25': 'PM25National.csv',
-        'SO2': 'Sulfur_DioxideNational.csv',
-    }
-    file = filenames.get(pollutant_name)
+    file = NATIONAL_FILES.get(pollutant_name)
     if not file:
         st.error(f"No file mapped for pollutant {pollutant_name}")
         return pd.DataFrame()
     return load_csv("National_trend", file)
 
+@st.cache_data(show_spinner=False)
+def load_applications_data():
+    df = load_csv("finance", "airqualityapplications2024.csv")
+    df['Proposed EPA Funding'] = parse_amount(df['Proposed EPA Funding'])
+    return df
+
+@st.cache_data(show_spinner=False)
+def load_application_state_rows():
+    states = load_applications_data()['Project State(s)'].dropna().str.split(", ").explode()
+    return states.groupby(states).groups
+
+@st.cache_data(show_spinner=False)
+def load_awards_data():
+    df = load_csv("finance", "AirQualityDirectAwards2022.csv")
+    df['Amount Awarded'] = parse_amount(df['Amount Awarded'])
+    df['EPA Region'] = df['EPA Region'].astype('category')
+    return df
+
+@st.cache_data(show_spinner=False)
+def load_budget_data():
+    df = load_csv("finance", "EPAbudget.csv")
+    df['Enacted Budget'] = parse_amount(df['Enacted Budget'])
+    df['Workforce'] = parse_amount(df['Workforce'])
+    return df
+
 # === Load datasets ===
 city_data = load_city_data()
-county_data = load_multiple_csvs("conreport", 2000, 2023)
+county_data = load_county_data()
 
 # === Tabs ===
 tabs = st.tabs(["City Trends", "County Trends", "National Trends", "Applications", "Awards", "EPA Budget"])
@@ -63,81 +189,78 @@ tabs = st.tabs(["City Trends", "County Trends", "National Trends", "Applications
 # --- Tab 1: City Trends ---
 with tabs[0]:
     st.subheader("City Air Quality Trends (2000–2023)")
-    cities = city_data['CBSA'] + " - " + city_data['Core Based Statistical Area']
-    selected_city = st.selectbox("Select a City", sorted(cities.unique()))
-    cbsa_code = selected_city.split(" - ")[0]
-    city_filtered = city_data[city_data['CBSA'] == cbsa_code]
+    city_options = load_city_options()
+    selected_city = st.selectbox("Select a City", list(city_options))
+    cbsa_code = city_options[selected_city]
+    city_filtered = city_data.loc[[cbsa_code]]
 
     st.write(f"Pollutant trends for {selected_city}:")
-    years = [str(y) for y in range(2000, 2024)]
+    yvals = city_filtered[YEAR_COLS].to_numpy()
+    labels = city_filtered['Pollutant'].astype(str) + " (" + city_filtered['Trend Statistic'].astype(str) + ")"
     fig, ax = plt.subplots(figsize=(12, 6))
-    for _, row in city_filtered.iterrows():
-        yvals = pd.to_numeric(row[4:], errors='coerce').fillna(0)
-        ax.plot(years, yvals, label=f"{row['Pollutant']} ({row['Trend Statistic']})")
+    ax.plot(YEAR_COLS, yvals.T)
     ax.set_xlabel("Year")
     ax.set_ylabel("Pollutant Level")
     ax.set_title(f"Pollutant Trends in {selected_city}")
-    ax.legend()
+    ax.legend(labels.tolist())
     ax.grid(True)
-    st.pyplot(fig)
+    st.pyplot(fig, clear_figure=True)
+    plt.close(fig)
 
 # --- Tab 2: County Trends ---
 with tabs[1]:
     st.subheader("County Air Quality Trends (2000–2023)")
     if not county_data.empty:
-        county = st.selectbox("Select a County", sorted(county_data['County'].dropna().unique()))
-        pollutant = st.selectbox("Select a Pollutant", [col for col in county_data.columns if col not in ['County', 'County Code', 'Year']])
-        df = county_data[county_data['County'] == county][['Year', pollutant]].dropna()
-        if df.empty:
+        county = st.selectbox("Select a County", county_data['County'].cat.categories)
+        pollutant = st.selectbox("Select a Pollutant", COUNTY_POLLUTANTS)
+        if load_county_pollutant_counts().at[county, pollutant] < MIN_TREND_POINTS:
             st.warning("Not enough data for this selection.")
         else:
-            fig, ax = plt.subplots(figsize=(10, 5))
-            ax.plot(df['Year'], df[pollutant], marker='o')
-            ax.set_title(f"{pollutant} in {county}")
-            ax.set_xlabel("Year")
-            ax.set_ylabel(pollutant)
-            ax.grid(True)
-            st.pyplot(fig)
-            st.dataframe(df.set_index("Year"))
+            df = county_data.loc[[county], ['Year', pollutant]].dropna().set_index("Year")
+            st.write(f"{pollutant} in {county}:")
+            st.line_chart(df, x_label="Year", y_label=pollutant)
+            st.dataframe(df)
 
 # --- Tab 3: National Trends ---
 with tabs[2]:
     st.subheader("National Pollutant Trends (2000–2023)")
-    selected_pollutant = st.selectbox("Choose Pollutant", ["CO", "NO2", "O3", "PM10", "PM25", "SO2"])
+    selected_pollutant = st.selectbox("Choose Pollutant", list(NATIONAL_FILES))
     national_df = load_national_pollutant(selected_pollutant)
     if not national_df.empty:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.plot(national_df['Year'], national_df['Mean'], label="Mean", marker='o')
-        ax.plot(national_df['Year'], national_df['10th Percentile'], label="10th Percentile", marker='x')
-        ax.plot(national_df['Year'], national_df['90th Percentile'], label="90th Percentile", marker='s')
-        ax.set_xlabel("Year")
-        ax.set_ylabel(national_df['Units'].iloc[0] if 'Units' in national_df else '')
-        ax.set_title(f"National Trend of {selected_pollutant}")
-        ax.legend()
-        ax.grid(True)
-        st.pyplot(fig)
+        st.write(f"National Trend of {selected_pollutant}:")
+        st.line_chart(
+            national_df.set_index('Year')[['Mean', '10th Percentile', '90th Percentile']],
+            x_label="Year",
+            y_label=national_df['Units'].iloc[0] if 'Units' in national_df else '',
+        )
         st.dataframe(national_df)
 
 # --- Tab 4: Applications ---
 with tabs[3]:
     st.subheader("Air Quality Applications (2024)")
-    df = load_csv("finance", "airqualityapplications2024.csv")
-    df['Proposed EPA Funding'] = df['Proposed EPA Funding'].replace('[\$,]', '', regex=True).astype(float)
-    st.dataframe(df)
-    st.bar_chart(df.groupby("Primary Applicant")['Proposed EPA Funding'].sum())
+    df = load_applications_data()
+    state_rows = load_application_state_rows()
+    selected_state = st.selectbox("Select a State", sorted(state_rows))
+    state_df = df.loc[state_rows[selected_state]]
+    st.dataframe(state_df)
+    st.write("Top 10 applicants by proposed funding:")
+    st.bar_chart(state_df.groupby("Primary Applicant")['Proposed EPA Funding'].sum().nlargest(10))
+    st.write(f"Total proposed funding for {selected_state}: ${state_df['Proposed EPA Funding'].sum():,.0f}")
 
 # --- Tab 5: Awards ---
 with tabs[4]:
     st.subheader("Direct Awards (2022)")
-    df = load_csv("finance", "AirQualityDirectAwards2022.csv")
-    df['Amount Awarded'] = df['Amount Awarded'].replace('[\$,]', '', regex=True).astype(float)
-    st.dataframe(df)
-    st.bar_chart(df.groupby("Grant Recipient")['Amount Awarded'].sum())
+    df = load_awards_data()
+    selected_region = st.selectbox("Select an EPA Region", df['EPA Region'].cat.categories)
+    region_df = df[df['EPA Region'] == selected_region]
+    st.dataframe(region_df)
+    st.write("Top 10 recipients by amount awarded:")
+    st.bar_chart(region_df.groupby("Grant Recipient")['Amount Awarded'].sum().nlargest(10))
+    st.write(f"Total awarded in Region {selected_region}: ${region_df['Amount Awarded'].sum():,.0f}")
 
 # --- Tab 6: EPA Budget ---
 with tabs[5]:
     st.subheader("EPA Budget (2000–2023)")
-    df = load_csv("finance", "EPAbudget.csv")
-    df['Enacted Budget'] = df['Enacted Budget'].replace('[\$,]', '', regex=True).astype(float)
+    df = load_budget_data()
     st.line_chart(df.set_index("Fiscal Year")[["Enacted Budget", "Workforce"]])
     st.dataframe(df)